@@ -3,36 +3,196 @@ from services.rag_no_agents import NoAgentRAG
 import streamlit as st
 import os
 from mistralai import Mistral
-from dotenv import load_dotenv
 from prompts.system_prompts import DEFAULT_ASSISTANT_PROMPT, VISUALIZATION_EXPERT_PROMPT
 from utils.code_interpreter import CodeInterpreter
-from typing import Optional
-from datetime import datetime
+from utils.semantic_cache import SemanticCache
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
 from config import MISTRAL_API_KEY, SnowflakeConfig
 from components.mindmap import MindMap
 from components.videorag import VideoRAG
 import codecs
-from utils.chat_utils import start_new_chat
+import ahocorasick
+import re
+import time
+import atexit
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from utils.chat_utils import create_chat
+
+# File prefix for the persisted semantic caches, suffixed by RAG type
+SEMANTIC_CACHE_PATH = os.path.join(".cache", "semantic_cache")
+
+RAG_TYPES = ("no_agents", "with_agents")
+
+# Runs RAG retrieval in the background while the query is embedded
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-retrieval")
+
+# Fenced code block in a visualization response, the closing fence may be
+# missing when the output was cut off
+_CODE_RE = re.compile(r"```(?:python)?\s*\n(.*?)(?:```|\Z)", re.S)
+
+# Maximum number of visualization results kept for identical code
+VIZ_CACHE_SIZE = 32
+
+# Number of most recent messages rendered on each rerun
+DEFAULT_WINDOW_SIZE = 50
+
+# Keywords used to route user requests, matched in a single pass
+_INTENT_KEYWORDS = {
+    "mindmap": ['mind map', 'mindmap', 'knowledge graph', 'knowledgegraph'],
+    "visualization": ['histogram', 'plot', 'graph', 'visualize', 'chart'],
+}
+_INTENT_AC = ahocorasick.Automaton()
+for _intent, _keywords in _INTENT_KEYWORDS.items():
+    for _keyword in _keywords:
+        _INTENT_AC.add_word(_keyword, (_intent, _keyword))
+_INTENT_AC.make_automaton()
+
+# Keywords that must start a word, 'graph' would otherwise match words
+# like 'paragraph' or 'photograph'. Others also match inside compounds
+# such as 'scatterplot' or 'barchart'.
+_WORD_START_KEYWORDS = frozenset(['graph'])
+
+def classify(query_lc: str) -> str:
+    """Classify the kind of request a user query makes.
+    Mind map keywords take precedence since 'knowledge graph' also
+    contains a visualization keyword.
+    
+    Args:
+        query_lc (str): Lowercased user input text
+        
+    Returns:
+        str: 'mindmap', 'visualization' or 'chat'
+    """
+    kind = "chat"
+    for end, (intent, keyword) in _INTENT_AC.iter(query_lc):
+        start = end - len(keyword) + 1
+        if keyword in _WORD_START_KEYWORDS and start and query_lc[start - 1].isalnum():
+            continue
+        if intent == "mindmap":
+            return intent
+        kind = intent
+    return kind
+
+def iter_stream_text(stream) -> Iterator[str]:
+    """Yield the text deltas of a Mistral chat stream.
+    
+    Args:
+        stream: Event stream returned by chat.stream
+        
+    Yields:
+        str: Non-empty content chunks in arrival order
+    """
+    for chunk in stream:
+        content = chunk.data.choices[0].delta.content
+        if content:
+            yield content
+
+def render_stream(chunks: Iterable[str], render: Callable[[str], Any], flush_interval: float = 0.1) -> str:
+    """Incrementally render streamed text, batching UI updates.
+    Each render call re-draws the whole element, so updates are flushed
+    at most once per flush_interval seconds plus once at the end.
+    
+    Args:
+        chunks (Iterable[str]): Text chunks to accumulate
+        render (Callable[[str], Any]): Callback drawing the accumulated text
+        flush_interval (float): Minimum seconds between two renders
+        
+    Returns:
+        str: Full accumulated text
+    """
+    buf = []
+    last_flush = time.monotonic()
+    for chunk in chunks:
+        buf.append(chunk)
+        now = time.monotonic()
+        if now - last_flush > flush_interval:
+            render("".join(buf))
+            last_flush = now
+    text = "".join(buf)
+    render(text)
+    return text
+
+@st.cache_resource(show_spinner=False)
+def get_mistral_client() -> Mistral:
+    """Return the Mistral client shared by all sessions.
+    The client holds no per-user state, so one HTTPS session is reused
+    instead of reconnecting on every message."""
+    return Mistral(api_key=MISTRAL_API_KEY)
+
+@st.cache_resource(show_spinner=False)
+def get_rag(rag_type: str):
+    """Return the RAG connector shared by all sessions for the given type.
+    Its Snowflake session is opened once per process and closed at exit.
+    
+    Args:
+        rag_type (str): 'no_agents' or 'with_agents'
+        
+    Returns:
+        NoAgentRAG or FilteredAgentRAG connector
+    """
+    snowflake_config = SnowflakeConfig()
+    if rag_type == 'with_agents':
+        rag = FilteredAgentRAG(snowflake_config)
+    else:
+        rag = NoAgentRAG(snowflake_config)
+    atexit.register(rag.session.close)
+    return rag
+
+@st.cache_resource(show_spinner=False)
+def get_semantic_cache(rag_type: str) -> SemanticCache:
+    """Return the semantic cache shared by all sessions for the given type.
+    Each RAG type answers differently, so each keeps its own cache and
+    snapshot, saved to disk when the process exits.
+    
+    Args:
+        rag_type (str): 'no_agents' or 'with_agents'
+        
+    Returns:
+        SemanticCache: Cache of knowledge base answers
+    """
+    cache = SemanticCache(1024, path=f"{SEMANTIC_CACHE_PATH}_{rag_type}")
+    atexit.register(cache.save)
+    return cache
+
+def clear_semantic_caches() -> None:
+    """Drop all cached knowledge base answers, in memory and on disk.
+    Called when documents are added so stale answers are not served."""
+    for rag_type in RAG_TYPES:
+        get_semantic_cache(rag_type).clear()
+
+def get_chatbot(rag_type: str = "no_agents") -> "Chatbot":
+    """Return this session's chatbot, rebuilding it when the RAG type changes.
+    Per-user state (code interpreter, video knowledge base, visualization
+    results) stays in session state, only the clients above are shared.
+    
+    Args:
+        rag_type (str): 'no_agents' or 'with_agents'
+        
+    Returns:
+        Chatbot: Chatbot instance of the current session
+    """
+    chatbot = st.session_state.get("chatbot")
+    if chatbot is None or chatbot.rag_type != rag_type:
+        if chatbot is not None:
+            chatbot.cleanup()
+        chatbot = Chatbot(rag_type=rag_type)
+        st.session_state.chatbot = chatbot
+    elif chatbot.snowflake is None and chatbot.mistral_client is not None:
+        # Earlier connection attempt failed, retry instead of silently
+        # answering without the knowledge base for the rest of the session
+        chatbot.connect_rag()
+    return chatbot
 
 def init_chat_history():
     """Initialize or retrieve chat history from session state.
-    Creates a new chat session if none exists, with a timestamp-based ID
+    Creates a new chat session if none exists, with a counter-based ID
     and default welcome message."""
     if "chats" not in st.session_state:
         st.session_state.chats = {}
     
     if "current_chat_id" not in st.session_state:
-        new_chat_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-        st.session_state.current_chat_id = new_chat_id
-        st.session_state.chats[new_chat_id] = {
-            "title": "New Chat",
-            "messages": [
-                {
-                    "role": "assistant",
-                    "content": "Hi! I'm Lexis, your AI research assistant. Unlike generic AI, I specialize in analyzing documents, answering complex questions, and even creating knowledge graphs to visualize insights. Ready to dive in? 🤖"
-                }
-            ]
-        }
+        create_chat()
 
 def get_current_chat():
     """Retrieve messages from the current active chat session.
@@ -78,21 +238,28 @@ def render_chatbot():
     }
     </style>""", unsafe_allow_html=True)
     
-    # Load environment variables
-    load_dotenv()
-    
-    # Get API key from environment
-    api_key = MISTRAL_API_KEY
-    if not api_key:
+    # API key is read once when config is imported
+    if not MISTRAL_API_KEY:
+        st.error("MISTRAL_API_KEY is not configured.")
         return
     
     init_chat_history()
     # Add title with custom class
     st.markdown('<h1 class="chat-title">💬 Chat with Lexis</h1>', unsafe_allow_html=True)
 
-    # Display current chat messages
+    # Display current chat messages, older ones are loaded on demand
     messages = get_current_chat()
-    for message in messages:
+    # Window size is tracked per chat, so loading history in one long chat
+    # does not enlarge the window of every other chat
+    window_sizes = st.session_state.setdefault('window_sizes', {})
+    chat_id = st.session_state.current_chat_id
+    window_size = window_sizes.get(chat_id, DEFAULT_WINDOW_SIZE)
+    older, recent = messages[:-window_size], messages[-window_size:]
+    if older:
+        if st.button(f"Load earlier messages ({len(older)} hidden)", key="load_earlier_messages"):
+            window_sizes[chat_id] = window_size + DEFAULT_WINDOW_SIZE
+            st.rerun()
+    for message in recent:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
       
@@ -104,6 +271,8 @@ def render_chatbot():
     
     # Chat input
     if prompt := st.chat_input("Message Mistral..."):
+        # Lowercase once, shared by every keyword check below
+        prompt_lc = prompt.lower()
         # Add user message to chat
         with st.chat_message("user"):
             st.markdown(prompt)
@@ -125,21 +294,25 @@ def render_chatbot():
             progress_bar = st.progress(0)
             
             try:
-                chatbot = Chatbot()
+                chatbot = get_chatbot(st.session_state.get('rag_type', 'no_agents'))
                 progress_bar.progress(30)  # Start processing
                 
                 # Check if it's a visualization request
-                if any(keyword in prompt.lower() for keyword in ['histogram', 'plot', 'graph', 'visualize', 'chart']):
+                if classify(prompt_lc) == "visualization":
                     progress_bar.progress(60)  # Visualization processing
                     response = chatbot.process_visualization_request(prompt)
                 else:
                     # Handle regular chat responses
                     progress_bar.progress(60)  # Query processing
-                    response = chatbot.process_query(prompt)
+                    response = chatbot.process_query(prompt, prompt_lc)
 
                 progress_bar.progress(100)  # Complete
                 progress_bar.empty()  # Remove progress bar
-                message_placeholder.markdown(response)
+                if isinstance(response, str):
+                    message_placeholder.markdown(response)
+                else:
+                    # Streamed response, render tokens as they arrive
+                    response = render_stream(response, message_placeholder.markdown)
                 add_message("assistant", f"{response}")
                 
                 # Add more space below the last response
@@ -150,9 +323,9 @@ def render_chatbot():
                 progress_bar.empty()  # Remove progress bar
                 message_placeholder.error(f"Error: {str(e)}")
 
-def is_youtube_url(query: str) -> bool:
-    """Check if the query contains a YouTube URL."""
-    return any(x in query.lower() for x in ['youtube.com/watch?v=', 'youtu.be/', 'youtube.com/shorts/'])
+def is_youtube_url(query_lc: str) -> bool:
+    """Check if the lowercased query contains a YouTube URL."""
+    return any(x in query_lc for x in ['youtube.com/watch?v=', 'youtu.be/', 'youtube.com/shorts/'])
 
 class Chatbot:
     """Main chatbot class handling message processing and responses.
@@ -164,52 +337,72 @@ class Chatbot:
     - Mind map generation
     """
 
-    def __init__(self):
+    def __init__(self, rag_type: Optional[str] = None):
         """Initialize chatbot components including:
         - Code interpreter for running visualization code
         - Mistral AI client for language processing
-        - Snowflake connector for knowledge base access"""
+        - Snowflake connector for knowledge base access
+        - Semantic cache for answers to near-duplicate queries
+        
+        Args:
+            rag_type (Optional[str]): 'no_agents' or 'with_agents',
+                defaults to the type selected in session state
+        """
+        if rag_type is None:
+            rag_type = st.session_state.get('rag_type', 'no_agents')
+        self.rag_type = rag_type
         self.code_interpreter = CodeInterpreter()
+        # Visualization results of this session, keyed by generated code
+        self.viz_results = {}
+        self.cache = get_semantic_cache(rag_type)
         
+        self.snowflake = None
+        self.video_rag = None
+        self.current_video_id = None
+
         # Initialize Mistral client
-        api_key = MISTRAL_API_KEY
-        if not api_key:
-            # Instead of raising an error, just set client to None
-            self.mistral_client = None
-            return
-        self.mistral_client = Mistral(api_key=api_key)
-        
-        # Initialize Snowflake RAG
+        # Instead of raising an error, just set client to None
+        self.mistral_client = get_mistral_client() if MISTRAL_API_KEY else None
+        if self.mistral_client is not None:
+            # Initialize Snowflake RAG
+            self.connect_rag()
+
+            # Initialize VideoRAG
+            self.video_rag = VideoRAG(self.mistral_client)
+
+        # Tear down when the chatbot is released or at interpreter exit,
+        # whichever comes first; cleanup() triggers the same finalizer
+        self._finalizer = weakref.finalize(
+            self,
+            Chatbot._safe_cleanup,
+            self.code_interpreter,
+            self.video_rag,
+        )
+
+    def connect_rag(self) -> None:
+        """Connect to the shared Snowflake RAG connector for this chatbot's
+        RAG type. On failure an error is shown and snowflake stays None,
+        so the connection is retried on the next message."""
         try:
-            snowflake_config = SnowflakeConfig()
-            if st.session_state.get('rag_type', 'no_agents') == 'with_agents':
-                self.snowflake = FilteredAgentRAG(snowflake_config)
-            else:
-                self.snowflake = NoAgentRAG(snowflake_config)
-                
+            self.snowflake = get_rag(self.rag_type)
         except Exception as e:
             st.error(f"Error initializing Snowflake: {str(e)}")
             self.snowflake = None
 
-        # Initialize VideoRAG
-        self.video_rag = VideoRAG(self.mistral_client)
-        self.current_video_id = None
-
-    def is_mindmap_request(self, query: str) -> bool:
+    def is_mindmap_request(self, query: str, query_lc: Optional[str] = None) -> bool:
         """Detect if user query is requesting mind map visualization
         by checking for relevant keywords.
         
         Args:
             query (str): User input text
+            query_lc (Optional[str]): Precomputed lowercase of query
             
         Returns:
             bool: True if query appears to be requesting a mind map
         """
-        mindmap_keywords = [
-            'mind map', 'mindmap', 'knowledge graph', 'knowledgegraph',
-            'mindmaps', 'knowledge graphs', 'knowledgegraphs'
-        ]
-        return any(keyword in query.lower() for keyword in mindmap_keywords)
+        if query_lc is None:
+            query_lc = query.lower()
+        return classify(query_lc) == "mindmap"
 
     def process_mindmap_request(self, query: str) -> str:
         """Generate and display an interactive mind map based on user query.
@@ -250,11 +443,11 @@ class Chatbot:
         Process:
         1. Get visualization code from Mistral AI
         2. Extract pure Python code from response
-        3. Execute code through interpreter
+        3. Execute code through interpreter, reusing results of identical code
         4. Display results
         """
         try:
-            response = self.mistral_client.chat.complete(
+            stream = self.mistral_client.chat.stream(
                 model="mistral-large-latest",
                 messages=[
                     {"role": "system", "content": VISUALIZATION_EXPERT_PROMPT},
@@ -262,17 +455,28 @@ class Chatbot:
                 ]
             )
             
-            # Extract just the Python code from the response
-            code = response.choices[0].message.content
+            # Show the generated code while it streams in
+            code_placeholder = st.empty()
+            code = render_stream(
+                iter_stream_text(stream),
+                lambda text: code_placeholder.code(text, language="python")
+            )
+            code_placeholder.empty()
             
             # If the response contains markdown code blocks, extract just the code
-            if "```python" in code:
-                code = code.split("```python")[1].split("```")[0].strip()
-            elif "```" in code:
-                code = code.split("```")[1].split("```")[0].strip()
+            m = _CODE_RE.search(code)
+            code = m.group(1).strip() if m else code.strip()
             
-            # Execute the code
-            results = self.code_interpreter.execute_code(code)
+            # Execute the code, results depend only on the code unless
+            # the user provided data for it to read
+            cacheable = 'visualization_data' not in st.session_state
+            results = self.viz_results.get(code) if cacheable else None
+            if results is None:
+                results = self.code_interpreter.execute_code(code)
+                if results and cacheable:
+                    if len(self.viz_results) >= VIZ_CACHE_SIZE:
+                        self.viz_results.pop(next(iter(self.viz_results)))
+                    self.viz_results[code] = results
             if results:
                 self.code_interpreter.display_results(results)
                 return "I've created the visualization based on your request. Let me know if you'd like any adjustments!"
@@ -282,14 +486,16 @@ class Chatbot:
             st.error(f"Error creating visualization: {str(e)}")
             return "Sorry, I encountered an error while creating the visualization."
 
-    def process_query(self, query: str) -> str:
+    def process_query(self, query: str, query_lc: Optional[str] = None) -> Union[str, Iterator[str]]:
         """Process user input and generate appropriate response.
         
         Args:
             query (str): User input text
+            query_lc (Optional[str]): Precomputed lowercase of query
             
         Returns:
-            str: Response text, potentially including source attribution
+            Union[str, Iterator[str]]: Response text, potentially including
+            source attribution, or streamed chunks for regular chat responses
             
         Handles multiple request types:
         - Mind map generation
@@ -298,33 +504,88 @@ class Chatbot:
         - Regular chat responses
         """
         try:
+            if query_lc is None:
+                query_lc = query.lower()
+            kind = classify(query_lc)
             # Check if query contains YouTube URL
-            if is_youtube_url(query):
+            if is_youtube_url(query_lc):
                 return self.video_rag.process_video_query(query)
             
             # If we have a current video and the query seems to be about it
-            elif self.current_video_id and not self.is_mindmap_request(query):
+            elif self.current_video_id and kind != "mindmap":
                 return self.video_rag.query_video(query, self.current_video_id)
             
             # Check if it's a mindmap request
-            elif self.is_mindmap_request(query):
+            elif kind == "mindmap":
                 return self.process_mindmap_request(query)
             # Check if it's a visualization request
-            elif any(keyword in query.lower() for keyword in ['histogram', 'plot', 'graph', 'visualize', 'chart']):
+            elif kind == "visualization":
                 return self.process_visualization_request(query)
             # Handle regular queries
             elif self.snowflake:
-                # Use NoAgentRAG's query method directly
-                return self.snowflake.query(query)
-            # else:
-            #     # Fallback to regular chat if Snowflake is not available
-            #     return self._process_regular_query(query)
+                return self._process_rag_query(query)
+            else:
+                # Fallback to regular chat if Snowflake is not available
+                return self._process_regular_query(query)
                 
         except Exception as e:
             st.error(f"Error processing query: {e}")
             return "Sorry, I encountered an error while processing your request."
 
-    def _process_regular_query(self, query: str) -> str:
+    def embed_query(self, query: str) -> list:
+        """Embed user query for semantic cache lookups.
+        
+        Args:
+            query (str): User input text
+            
+        Returns:
+            list: Query embedding from mistral-embed
+        """
+        response = self.mistral_client.embeddings.create(
+            model="mistral-embed",
+            inputs=[query]
+        )
+        return response.data[0].embedding
+
+    def _process_rag_query(self, query: str) -> str:
+        """Answer query from the knowledge base, reusing the cached answer
+        of a near-duplicate query when available.
+        
+        Plain search retrieval is cheap, so it runs concurrently with the
+        query embedding and is discarded on a cache hit. The agent pipeline
+        makes several LLM calls and only starts after a cache miss.
+        
+        Args:
+            query (str): User input text
+            
+        Returns:
+            str: Response text with source attribution
+        """
+        retrieval = None
+        if isinstance(self.snowflake, NoAgentRAG):
+            retrieval = _RETRIEVAL_EXECUTOR.submit(self.snowflake.retrieve, query)
+
+        try:
+            embedding = self.embed_query(query)
+        except Exception as e:
+            # The cache is only an optimization, answer without it
+            print(f"Error embedding query, skipping semantic cache: {e}")
+            embedding = None
+        if embedding is not None:
+            cached = self.cache.get(embedding)
+            if cached is not None:
+                return cached
+
+        if retrieval is None:
+            context = self.snowflake.retrieve(query)
+        else:
+            context = retrieval.result()
+        response = self.snowflake.generate_completion(query, context)
+        if embedding is not None:
+            self.cache.put(embedding, response)
+        return response
+
+    def _process_regular_query(self, query: str) -> Iterator[str]:
         """Handle standard chat queries without RAG enhancement.
         Used as fallback when Snowflake connection unavailable.
         
@@ -332,32 +593,37 @@ class Chatbot:
             query (str): User input text
             
         Returns:
-            str: Direct response from Mistral AI
+            Iterator[str]: Streamed response chunks from Mistral AI
         """
-        response = self.mistral_client.chat.complete(
+        stream = self.mistral_client.chat.stream(
             model="mistral-large-latest",
             messages=[
                 {"role": "system", "content": DEFAULT_ASSISTANT_PROMPT},
                 {"role": "user", "content": query}
             ]
         )
-        return response.choices[0].message.content
+        return iter_stream_text(stream)
 
     def cleanup(self):
-        """Clean up resources and connections:
+        """Clean up resources owned by this chatbot:
         - Code interpreter cleanup
-        - Snowflake session closure
-        - VideoRAG cleanup"""
-        if hasattr(self, 'code_interpreter'):
-            self.code_interpreter.cleanup()
-        if hasattr(self, 'snowflake'):
-            try:
-                self.snowflake.session.close()
-            except:
-                pass
-        if hasattr(self, 'video_rag'):
-            self.video_rag.cleanup()
-
-    def __del__(self):
-        """Destructor to ensure proper resource cleanup when object is deleted."""
-        self.cleanup()
\ No newline at end of file
+        - VideoRAG cleanup
+        
+        The Mistral client, Snowflake session and semantic cache are shared
+        across sessions and outlive the chatbot.
+        
+        Safe to call more than once, only the first call has an effect."""
+        self._finalizer()
+
+    @staticmethod
+    def _safe_cleanup(code_interpreter, video_rag) -> None:
+        """Release the given chatbot resources. Takes the components rather
+        than the chatbot so it can run from a weakref finalizer.
+        
+        Args:
+            code_interpreter (CodeInterpreter): Interpreter to clean up
+            video_rag (VideoRAG): Video knowledge base to clean up, may be None
+        """
+        code_interpreter.cleanup()
+        if video_rag is not None:
+            video_rag.cleanup()
@@ -14,6 +14,7 @@ from streamlit.delta_generator import DeltaGenerator
 import os
 from mistralai import Mistral
 from dataclasses import dataclass, asdict
+from functools import lru_cache
 from textwrap import dedent
 from streamlit_agraph import agraph, Node, Edge, Config
 from prompts.system_prompts import (
@@ -25,8 +26,34 @@ from prompts.system_prompts import (
 NODE_COLOR = "#00CED1" 
 SELECTED_NODE_COLOR = "#FF4500"
 
+# Matches add("a", "b"), delete("a", "b") and delete("a") commands
+_EDGE_RE = re.compile(r'(add|delete)\("([^()"]+)"(?:,\s*"([^()"]+)")?\)')
+
+# Graph rendering settings, shared by every visualization
+GRAPH_CONFIG = Config(width="100%",
+                      height=500,
+                      directed=False, 
+                      physics=True,
+                      hierarchical=False,
+                      )
+
 mistral_client = Mistral(api_key=MISTRAL_API_KEY)
 
+# Prompt templates, dedented once at import and filled in per request
+_INITIAL_GRAPH_TEMPLATE = dedent("""
+    Great, now ignore all previous nodes and restart from scratch. I now want you do the following:    
+
+    {query}
+""").strip()
+_EXTEND_GRAPH_TEMPLATE = dedent("""
+    add new edges to new nodes, starting from the node "{selected_node}"
+""").strip()
+
+@lru_cache(maxsize=256)
+def _dedent_cached(content: str) -> str:
+    """Remove indentation and surrounding whitespace, memoized by content."""
+    return dedent(content).strip()
+
 @dataclass
 class Message:
     """Represents a message in a Mistral conversation.
@@ -41,25 +68,28 @@ class Message:
     def __post_init__(self):
         """Post-initialization hook to clean up message content.
         Removes indentation and extra whitespace."""
-        self.content = dedent(self.content).strip()
+        self.content = _dedent_cached(self.content)
 
 START_CONVERSATION = [
     Message(MINDMAP_SYSTEM_PROMPT, role="system"),
     Message(MINDMAP_INSTRUCTION_PROMPT, role="user"),
+] + [
+    # Add example conversation messages
+    Message(msg["content"], role=msg["role"]) for msg in MINDMAP_EXAMPLE_CONVERSATION
 ]
 
-# Add example conversation messages
-for msg in MINDMAP_EXAMPLE_CONVERSATION:
-    START_CONVERSATION.append(Message(msg["content"], role=msg["role"]))
+# Start conversation serialized once, in the format sent to Mistral
+_START_DICTS: List[dict] = [asdict(m) for m in START_CONVERSATION]
 
-def ask_mistral(conversation: List[Message]) -> Tuple[str, List[Message]]:
+def ask_mistral(conversation: List[dict]) -> Tuple[str, List[dict]]:
     """Send conversation to Mistral AI and get response.
     
     Args:
-        conversation (List[Message]): List of previous messages in the conversation
+        conversation (List[dict]): Previous messages in the conversation,
+            serialized as role/content dicts
         
     Returns:
-        Tuple[str, List[Message]]: 
+        Tuple[str, List[dict]]: 
             - Generated response text
             - Updated conversation history including the new response
             
@@ -67,13 +97,13 @@ def ask_mistral(conversation: List[Message]) -> Tuple[str, List[Message]]:
     """
     response = mistral_client.chat.complete(
         model="mistral-large-latest",
-        messages=[asdict(c) for c in conversation]
+        messages=conversation
     )
     msg = Message(
         content=response.choices[0].message.content,
         role="assistant"
     )
-    return msg.content, conversation + [msg]
+    return msg.content, conversation + [asdict(msg)]
 
 class MindMap:
     """Represents and manages an interactive mind map visualization.
@@ -94,9 +124,19 @@ class MindMap:
             nodes (Optional[List[str]]): List of node labels/content
         """
         self.edges = [] if edges is None else edges
-        self.nodes = [] if nodes is None else nodes
+        # dict used as an insertion-ordered set, so node order does not
+        # depend on the hash seed and the rendered layout stays stable
+        self._nodes = {} if nodes is None else dict.fromkeys(nodes)
+        # agraph nodes/edges built for the last selected node
+        self._vis_cache: Optional[Tuple[List[Node], List[Edge]]] = None
+        self._vis_selected = None
         self.save()
 
+    @property
+    def nodes(self) -> List[str]:
+        """List of node labels currently in the graph."""
+        return list(self._nodes)
+
     @classmethod
     def load(cls) -> MindMap:
         """Load existing mind map from session state or create new one.
@@ -109,7 +149,9 @@ class MindMap:
         return cls()
 
     def save(self) -> None:
-        """Save current mind map state to session storage for persistence."""
+        """Save current mind map state to session storage for persistence.
+        Invalidates the cached visualization since the graph may have changed."""
+        self._vis_cache = None
         st.session_state["mindmap"] = self
 
     def is_empty(self) -> bool:
@@ -131,12 +173,8 @@ class MindMap:
         2. Parse response to extract node relationships
         3. Update graph structure with new nodes and edges
         """
-        conversation = START_CONVERSATION + [
-            Message(f"""
-                Great, now ignore all previous nodes and restart from scratch. I now want you do the following:    
-
-                {query}
-            """, role="user")
+        conversation = _START_DICTS + [
+            {"content": _INITIAL_GRAPH_TEMPLATE.format(query=query).strip(), "role": "user"}
         ]
 
         output, self.conversation = ask_mistral(conversation)
@@ -156,13 +194,11 @@ class MindMap:
 
         if selected_node is not None:
             conversation = self.conversation + [
-                Message(f"""
-                    add new edges to new nodes, starting from the node "{selected_node}"
-                """, role="user")
+                {"content": _EXTEND_GRAPH_TEMPLATE.format(selected_node=selected_node), "role": "user"}
             ]
             st.session_state.last_expanded = selected_node
         else:
-            conversation = self.conversation + [Message(text, role="user")]
+            conversation = self.conversation + [asdict(Message(text, role="user"))]
 
         output, self.conversation = ask_mistral(conversation)
         self.parse_and_include_edges(output, replace=False)
@@ -181,44 +217,51 @@ class MindMap:
         4. Remove any duplicate edges
         """
 
-        pattern1 = r'(add|delete)\("([^()"]+)",\s*"([^()"]+)"\)'
-        pattern2 = r'(delete)\("([^()"]+)"\)'
-
-        matches = re.findall(pattern1, output) + re.findall(pattern2, output)
-
         new_edges = []
         remove_edges = set()
         remove_nodes = set()
-        for match in matches:
-            op, *args = match
-            add = op == "add"
-            if add or (op == "delete" and len(args)==2):
-                a, b = args
-                if a == b:
-                    continue
-                if add:
-                    new_edges.append((a, b))
-                else:
-                    # remove both directions
-                    # (undirected graph)
-                    remove_edges.add(frozenset([a, b]))
-            else: # must be delete of node
-                remove_nodes.add(args[0])
+        for m in _EDGE_RE.finditer(output):
+            op, a, b = m.groups()
+            if b is None:
+                # single argument is only valid as delete of node
+                if op == "delete":
+                    remove_nodes.add(a)
+                continue
+            if a == b:
+                continue
+            if op == "add":
+                new_edges.append((a, b))
+            else:
+                # remove both directions
+                # (undirected graph)
+                remove_edges.add(tuple(sorted((a, b))))
 
         if replace:
             edges = new_edges
         else:
             edges = self.edges + new_edges
 
-        added = set()
-        for edge in edges:
-            nodes = frozenset(edge)
-            if nodes in added or nodes & remove_nodes or nodes in remove_edges:
+        # canonical (sorted) pair -> edge in its original direction
+        added = {}
+        for a, b in edges:
+            key = tuple(sorted((a, b)))
+            if key in added or key in remove_edges or a in remove_nodes or b in remove_nodes:
                 continue
-            added.add(nodes)
+            added[key] = (a, b)
 
-        self.edges = list([tuple(a) for a in added])
-        self.nodes = list(set([n for e in self.edges for n in e]))
+        self.edges = list(added.values())
+        # Nodes only leave the graph when deleted explicitly, nodes that
+        # lose their last edge stay as isolated nodes (as in _delete_node).
+        # Replacing starts a new graph made of the new edges only.
+        if replace:
+            self._nodes = {}
+        else:
+            for n in remove_nodes:
+                self._nodes.pop(n, None)
+        for a, b in new_edges:
+            if tuple(sorted((a, b))) in added:
+                self._nodes[a] = None
+                self._nodes[b] = None
         self.save()
 
     def _delete_node(self, node) -> None:
@@ -229,15 +272,15 @@ class MindMap:
             
         Effects:
         - Removes all edges connected to the node
-        - Updates node list to reflect changes
+        - Removes the node itself, former neighbours are kept
         - Records deletion in conversation history
         """
-        self.edges = [e for e in self.edges if node not in frozenset(e)]
-        self.nodes = list(set([n for e in self.edges for n in e]))
-        self.conversation.append(Message(
+        self._nodes.pop(node, None)
+        self.edges = [e for e in self.edges if node not in e]
+        self.conversation.append(asdict(Message(
             f'delete("{node}")', 
             role="user"
-        ))
+        )))
         self.save()
 
     def visualize(self) -> None | str:
@@ -256,25 +299,24 @@ class MindMap:
         """
         try:
             selected = st.session_state.get("last_expanded")
-            vis_nodes = [
-                Node(
-                    id=n, 
-                    label=n, 
-                    size=10+10*(n==selected), 
-                    color=NODE_COLOR if n != selected else SELECTED_NODE_COLOR
-                ) 
-                for n in self.nodes
-            ]
-            vis_edges = [Edge(source=a, target=b) for a, b in self.edges]
-            config = Config(width="100%",
-                          height=500,
-                          directed=False, 
-                          physics=True,
-                          hierarchical=False,
-                          )
+            if self._vis_cache is not None and self._vis_selected == selected:
+                vis_nodes, vis_edges = self._vis_cache
+            else:
+                vis_nodes = [
+                    Node(
+                        id=n, 
+                        label=n, 
+                        size=10+10*(n==selected), 
+                        color=NODE_COLOR if n != selected else SELECTED_NODE_COLOR
+                    ) 
+                    for n in self.nodes
+                ]
+                vis_edges = [Edge(source=a, target=b) for a, b in self.edges]
+                self._vis_cache = (vis_nodes, vis_edges)
+                self._vis_selected = selected
             clicked_node = agraph(nodes=vis_nodes, 
                             edges=vis_edges, 
-                            config=config)
+                            config=GRAPH_CONFIG)
             
             return clicked_node
             
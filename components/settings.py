@@ -1,9 +1,9 @@
 import streamlit as st
 import os
-from dotenv import load_dotenv
 import pandas as pd
-from config import MISTRAL_API_KEY, SNOWFLAKE_ACCOUNT, SNOWFLAKE_DATABASE, SNOWFLAKE_PASSWORD, SNOWFLAKE_SCHEMA, SNOWFLAKE_SEARCH_SERVICE, SNOWFLAKE_STAGE_NAME, SNOWFLAKE_USER, SNOWFLAKE_WAREHOUSE
+from config import SNOWFLAKE_ACCOUNT, SNOWFLAKE_DATABASE, SNOWFLAKE_PASSWORD, SNOWFLAKE_SCHEMA, SNOWFLAKE_SEARCH_SERVICE, SNOWFLAKE_STAGE_NAME, SNOWFLAKE_USER, SNOWFLAKE_WAREHOUSE
 from utils.chat_utils import start_new_chat
+from components.chatbot import clear_semantic_caches
 from utils.snowflake_utils import upload_pdf_to_snowflake
 
 connection_params = {
@@ -16,12 +16,6 @@ connection_params = {
 }
 
 def render_settings():
-    # Load environment variables
-    load_dotenv()
-    
-    # Get API key from environment or session state
-    default_api_key = MISTRAL_API_KEY
-    
     # Conversations section
     st.sidebar.markdown('<h1>Conversations</h1>', unsafe_allow_html=True)
     
@@ -180,6 +174,8 @@ def render_settings():
                 # ADD HERE: Call upload_pdf_to_snowflake with the uploaded file
                 with st.spinner(f"Processing and uploading '{uploaded_file.name}' to Snowflake..."):
                     upload_pdf_to_snowflake(connection_params, uploaded_file)
+                # Cached answers predate the new document
+                clear_semantic_caches()
                 
                 st.sidebar.success(f"File '{uploaded_file.name}' uploaded successfully! Size: {len(file_bytes) / 1024:.2f} KB")
         except Exception as e:
@@ -1,19 +1,37 @@
-from datetime import datetime
+WELCOME_MESSAGE = "Hi! I'm Lexis, your AI research assistant. Unlike generic AI, I specialize in analyzing documents, answering complex questions, and even creating knowledge graphs to visualize insights. Ready to dive in? 🤖"
 
-def start_new_chat():
-    """Create a fresh chat session with a new timestamp-based ID.
-    Initializes with default welcome message and triggers page rerun."""
+def create_chat(make_current: bool = True) -> str:
+    """Register a fresh chat session with the default welcome message.
+    IDs come from a per-session counter, so chats created within the same
+    second never overwrite each other.
+
+    Args:
+        make_current (bool): Whether to switch to the new chat
+
+    Returns:
+        str: ID of the new chat
+    """
     import streamlit as st
-    
-    new_chat_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-    st.session_state.current_chat_id = new_chat_id
-    st.session_state.chats[new_chat_id] = {
+
+    seq = st.session_state.get('_chat_seq', 0)
+    st.session_state['_chat_seq'] = seq + 1
+    new_chat_id = f"c{seq}"
+    st.session_state.setdefault('chats', {})[new_chat_id] = {
         "title": "New Chat",
         "messages": [
             {
                 "role": "assistant",
-                "content": "Hi! I'm a chatbot powered by Mistral AI. I can help you analyze documents, answer questions, and assist with various tasks. How can I help you today? 🤖"
+                "content": WELCOME_MESSAGE
             }
         ]
     }
-    st.rerun() 
\ No newline at end of file
+    if make_current:
+        st.session_state.current_chat_id = new_chat_id
+    return new_chat_id
+
+def start_new_chat():
+    """Create a fresh chat session, switch to it and trigger page rerun."""
+    import streamlit as st
+
+    create_chat()
+    st.rerun()
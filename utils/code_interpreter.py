@@ -38,9 +38,12 @@ class CodeInterpreter:
                 stdout = StringIO()
                 stderr = StringIO()
                 
-                # Add data to globals if it exists in session state
+                # Add data to globals if it exists in session state,
+                # and drop data left over from an earlier run otherwise
                 if 'visualization_data' in st.session_state:
                     self.globals['data'] = st.session_state.visualization_data
+                else:
+                    self.globals.pop('data', None)
                 
                 with contextlib.redirect_stdout(stdout), \
                      contextlib.redirect_stderr(stderr), \
@@ -0,0 +1,158 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+import hnswlib
+import numpy as np
+
+# Below this many entries a linear scan beats traversing the HNSW graph
+LINEAR_SCAN_LIMIT = 256
+
+
+class SemanticCache:
+    """Cache of responses keyed by query embedding.
+
+    Embeddings are L2-normalized and stored in an HNSW index labelled by
+    entry slot. Small caches are searched with a single matrix-vector product
+    over a contiguous float16 copy of the first LINEAR_SCAN_LIMIT slots, the
+    only ones that scan ever reads; larger caches go through the index. When
+    the cache is full, the least recently used entry is overwritten. Operations are serialized by a lock so one cache can be
+    shared between Streamlit sessions.
+    """
+
+    def __init__(self, dim: int, threshold: float = 0.95, maxlen: int = 4096,
+                 path: Optional[str] = None):
+        """Initialize the cache, restoring it from disk if a snapshot exists.
+
+        Args:
+            dim (int): Dimension of the query embeddings
+            threshold (float): Minimum cosine similarity for a cache hit
+            maxlen (int): Maximum number of cached entries
+            path (Optional[str]): File prefix used to persist the cache
+        """
+        self.dim = dim
+        self.threshold = threshold
+        self.maxlen = maxlen
+        self.path = path
+        # Linear scan rows only; float16 halves them and their snapshot (the
+        # HNSW index keeps its own float32 vectors), unit vectors lose well
+        # under the similarity threshold margin
+        self._emb = np.zeros((min(maxlen, LINEAR_SCAN_LIMIT), dim), dtype=np.float16)
+        self._payloads: List[Any] = [None] * maxlen
+        self._lru: OrderedDict = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.index = hnswlib.Index(space="cosine", dim=dim)
+        if path and os.path.exists(f"{path}.bin") and os.path.exists(f"{path}.pkl"):
+            self._load()
+        else:
+            self.index.init_index(max_elements=maxlen, ef_construction=200, M=16)
+        self.index.set_ef(50)
+
+    def clear(self) -> None:
+        """Drop every entry, including the snapshot on disk, e.g. after the
+        knowledge base changed and cached answers may be stale."""
+        with self._lock:
+            self._payloads = [None] * self.maxlen
+            self._lru.clear()
+            self._size = 0
+            self.index = hnswlib.Index(space="cosine", dim=self.dim)
+            self.index.init_index(max_elements=self.maxlen, ef_construction=200, M=16)
+            self.index.set_ef(50)
+            if self.path:
+                for suffix in (".bin", ".pkl"):
+                    if os.path.exists(f"{self.path}{suffix}"):
+                        os.remove(f"{self.path}{suffix}")
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _normalize(vec) -> np.ndarray:
+        """Convert an embedding to a unit-length float32 vector."""
+        vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _nearest(self, vec: np.ndarray) -> tuple:
+        """Return the row and similarity of the closest cached embedding."""
+        if self._size < LINEAR_SCAN_LIMIT:
+            # NumPy has no BLAS path for float16, upcast the rows to float32
+            scores = self._emb[:self._size].astype(np.float32) @ vec
+            idx = int(np.argmax(scores))
+            return idx, float(scores[idx])
+        labels, distances = self.index.knn_query(vec, k=1)
+        return int(labels[0][0]), 1 - float(distances[0][0])
+
+    def get(self, vec) -> Optional[Any]:
+        """Look up the payload of the most similar cached query.
+
+        Args:
+            vec: Query embedding
+
+        Returns:
+            Optional[Any]: Cached payload if its similarity reaches the
+            threshold, None otherwise
+        """
+        vec = self._normalize(vec)
+        with self._lock:
+            if not self._size:
+                return None
+            idx, score = self._nearest(vec)
+            if score < self.threshold:
+                return None
+            self._lru.move_to_end(idx)
+            return self._payloads[idx]
+
+    def put(self, vec, payload: Any) -> None:
+        """Store a payload under the given query embedding.
+
+        Args:
+            vec: Query embedding
+            payload (Any): Value returned by later similar lookups
+        """
+        vec = self._normalize(vec)
+        with self._lock:
+            if self._size < self.maxlen:
+                idx = self._size
+                self._size += 1
+            else:
+                idx, _ = self._lru.popitem(last=False)
+            if idx < len(self._emb):
+                self._emb[idx] = vec
+            # Re-adding an existing label replaces the evicted vector in the graph
+            self.index.add_items(vec[np.newaxis, :], [idx])
+            self._payloads[idx] = payload
+            self._lru[idx] = None
+
+    def save(self) -> None:
+        """Persist the index and payloads so a restart starts warm."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._size:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.index.save_index(f"{self.path}.bin")
+            with open(f"{self.path}.pkl", "wb") as f:
+                pickle.dump({
+                    "emb": self._emb[:min(self._size, len(self._emb))],
+                    "payloads": self._payloads[:self._size],
+                    "lru": list(self._lru),
+                }, f)
+
+    def _load(self) -> None:
+        """Restore the index and payloads written by save()."""
+        with open(f"{self.path}.pkl", "rb") as f:
+            state = pickle.load(f)
+        self._size = min(len(state["payloads"]), self.maxlen)
+        rows = min(self._size, len(self._emb), len(state["emb"]))
+        self._emb[:rows] = state["emb"][:rows]
+        self._payloads[:self._size] = state["payloads"][:self._size]
+        self._lru = OrderedDict((idx, None) for idx in state["lru"] if idx < self._size)
+        self.index.load_index(f"{self.path}.bin", max_elements=self.maxlen)